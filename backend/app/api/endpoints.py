@@ -1,24 +1,27 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse, JSONResponse
-from typing import Dict, List, Optional
+from fastapi.responses import JSONResponse
+from functools import partial
 import os
-import pandas as pd
+import anyio
+import polars as pl
 
 from app.core.models import (
     DatasetProfile, PlanRequest, PlanResponse, 
-    ExecutionRequest, ExecutionResult, JobStatus,
-    AIResponse
+    ExecutionRequest, ExecutionResult, JobStatus
 )
+from app.api.responses import SyncFileResponse
 from app.services.file_handler import FileHandler, RESULTS_DIR
+from app.services.job_store import JobStore
 from app.core.agent import agent, LLMRefusalError
 from app.core.executor import processor
 
 router = APIRouter()
 
-# Simple In-Memory Store
-# In production, use Redis/DB.
-JOBS: Dict[str, DatasetProfile] = {}
-PLANS: Dict[str, AIResponse] = {}
+# Parsing, profiling, plan execution, CSV writes and LLM calls are blocking;
+# they run on the threadpool via anyio.to_thread so the event loop stays responsive.
+
+# Job profiles and plans are shared across workers through Redis
+JOBS = JobStore()
 
 @router.post("/upload", response_model=DatasetProfile)
 async def upload_file(file: UploadFile = File(...)):
@@ -27,14 +30,21 @@ async def upload_file(file: UploadFile = File(...)):
     """
     try:
         # Save file
-        safe_filename = await FileHandler.save_upload(file)
-        file_path = FileHandler.get_file_path(safe_filename.split('.')[0]) # slightly redundant but safe
+        safe_filename, content_name = await FileHandler.save_upload(file)
+        job_id = safe_filename.split('.')[0]
         
-        # Generate Profile
-        profile = FileHandler.generate_profile(file_path, file.filename)
+        # Identical content was profiled before: reuse its profile (and cached table)
+        known_profile = await JOBS.find_by_content(content_name)
+        if known_profile is not None:
+            profile = known_profile.model_copy(update={"job_id": job_id, "filename": file.filename})
+            table = None
+        else:
+            # Generate Profile
+            file_path = FileHandler.get_file_path(job_id) # slightly redundant but safe
+            profile, table = await anyio.to_thread.run_sync(FileHandler.generate_profile, file_path, file.filename)
         
-        # Store in memory
-        JOBS[profile.job_id] = profile
+        # Store the profile (the parsed table is cached locally for /execute)
+        await JOBS.add(profile, content_name, table)
         
         return profile
     except HTTPException as he:
@@ -48,17 +58,16 @@ async def transform_data(request: PlanRequest):
     Generates a transformation plan based on user intent.
     """
     job_id = request.job_id
-    if job_id not in JOBS:
+    profile = await JOBS.get(job_id)
+    if profile is None:
         raise HTTPException(status_code=404, detail="Job not found. Please upload a file first.")
     
-    profile = JOBS[job_id]
-    
     try:
         # Call AI Agent
-        ai_response = agent.generate_transformation_plan(request.prompt, profile.columns)
+        ai_response = await anyio.to_thread.run_sync(agent.generate_transformation_plan, request.prompt, profile.columns)
         
         # Store plan for execution context
-        PLANS[job_id] = ai_response
+        await JOBS.set_plan(job_id, ai_response)
         
         return PlanResponse(
             job_id=job_id,
@@ -78,9 +87,11 @@ async def execute_plan(request: ExecutionRequest):
     Executes the approved plan.
     """
     job_id = request.job_id
-    if job_id not in JOBS:
+    profile = await JOBS.get(job_id)
+    if profile is None:
          raise HTTPException(status_code=404, detail="Job not found.")
-    if job_id not in PLANS:
+    plan = await JOBS.get_plan(job_id)
+    if plan is None:
          raise HTTPException(status_code=400, detail="No plan generated for this job.")
     
     if not request.approved:
@@ -92,35 +103,41 @@ async def execute_plan(request: ExecutionRequest):
             error="Execution was not approved."
         )
 
-    # Load Data
+    # Load Data (reuse the table parsed at upload, re-read only on cache miss)
     try:
-        file_path = FileHandler.get_file_path(job_id)
-        if file_path.endswith('.csv'):
-            df = pd.read_csv(file_path)
-        else:
-            df = pd.read_excel(file_path)
+        table = await JOBS.get_table(job_id)
+        if table is None:
+            table = await anyio.to_thread.run_sync(FileHandler.read_table, FileHandler.get_file_path(job_id))
+            await JOBS.cache_table(job_id, table)
+        # Keep the table's chunks: rechunking would copy every column. String offsets
+        # are still converted, so this runs on a worker thread, not the event loop.
+        df = await anyio.to_thread.run_sync(partial(pl.from_arrow, table, rechunk=False))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to load data: {str(e)}")
 
     # Execute
     try:
-        steps = PLANS[job_id].steps
-        result_df, execution_result = processor.execute_plan(df, steps, job_id)
+        steps = plan.steps
+        plan_hash = processor.plan_hash(steps)
+        validated = await JOBS.get_validated_hash(job_id) == plan_hash
+        result_df, execution_result = await anyio.to_thread.run_sync(partial(
+            processor.execute_plan, df, steps, job_id, skip_dry_run=validated, profile=profile
+        ))
         
         if execution_result.status == JobStatus.FAILED:
             return execution_result
+        await JOBS.set_validated_hash(job_id, plan_hash)
             
         # Save Result
         result_path = FileHandler.get_result_path(job_id)
-        result_df.to_csv(result_path, index=False)
+        await anyio.to_thread.run_sync(FileHandler.write_table, result_df, result_path)
         
         # Update Result with URL
         execution_result.download_url = f"/api/download/{job_id}"
         
         # Generate Preview for Diff Viewer
-        preview_df = result_df.head(10).copy()
-        # Handle NaNs for JSON
-        execution_result.preview = preview_df.where(pd.notnull(preview_df), None).to_dict(orient="records")
+        # Arrow emits None for nulls, so no NaN sanitization is needed for JSON
+        execution_result.preview = result_df.head(10).to_arrow().to_pylist()
         
         return execution_result
 
@@ -139,11 +156,15 @@ async def download_result(job_id: str):
     Downloads the processed file.
     """
     result_path = FileHandler.get_result_path(job_id)
-    if not os.path.exists(result_path):
+    try:
+        # Stat once here so the response does not stat the file again
+        stat_result = os.stat(result_path)
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Result file not found.")
     
-    return FileResponse(
+    return SyncFileResponse(
         result_path, 
         media_type='text/csv', 
-        filename=f"fridata_cleaned_{job_id}.csv"
+        filename=f"fridata_cleaned_{job_id}.csv",
+        stat_result=stat_result
     )
@@ -0,0 +1,34 @@
+from fastapi.responses import FileResponse
+from starlette.types import Receive, Scope, Send
+
+class SyncFileResponse(FileResponse):
+    """
+    FileResponse that streams the file with plain blocking reads.
+    Starlette's FileResponse hops to the threadpool for every chunk (anyio.open_file);
+    result files are freshly written and served from the page cache, so a direct read is cheaper.
+    Servers offering the ASGI pathsend extension still get the zero-copy path.
+    """
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        use_default = (
+            self.stat_result is None
+            or scope["method"].upper() == "HEAD"
+            or "http.response.pathsend" in scope.get("extensions", {})
+        )
+        if use_default:
+            await super().__call__(scope, receive, send)
+            return
+
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+        with open(self.path, "rb") as file:
+            more_body = True
+            while more_body:
+                chunk = file.read(self.chunk_size)
+                more_body = len(chunk) == self.chunk_size
+                await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        if self.background is not None:
+            await self.background()
@@ -1,5 +1,9 @@
 import os
+import json
+import hashlib
+import threading
 import instructor
+from cachetools import TTLCache
 import google.generativeai as genai
 from typing import List, Dict, Any, Optional
 from app.core.models import AIResponse, TransformStep, ColumnProfile
@@ -58,15 +62,30 @@ ALLOWED_OPERADORS = {
     "date": {">", "<", ">=", "<=", "=="}
 }
 
+# Validated plans are reused for identical (prompt, schema) pairs
+PLAN_CACHE_SIZE = 10_000
+PLAN_CACHE_TTL_SEC = 3600
+
 class Agent:
     def __init__(self):
         self.model = genai.GenerativeModel("gemini-pro") 
+        # cache key -> AIResponse serialized as JSON
+        self._plan_cache = TTLCache(maxsize=PLAN_CACHE_SIZE, ttl=PLAN_CACHE_TTL_SEC)
+        # Plans are generated on worker threads and cachetools caches are not thread-safe
+        self._plan_cache_lock = threading.Lock()
 
     def generate_transformation_plan(self, user_input: str, schema_profile: List[ColumnProfile]) -> AIResponse:
         """
         Generates a transformation plan from user input, strictly validated against the schema.
+        Repeated requests for the same prompt and schema are served from cache without calling the LLM.
         """
-        
+        cache_key = self._plan_cache_key(user_input, schema_profile)
+        with self._plan_cache_lock:
+            cached = self._plan_cache.get(cache_key)
+        if cached is not None:
+            # Deserialize so every caller gets its own copy of the plan
+            return AIResponse.model_validate_json(cached)
+
         # 1. Construct Schema Context
         schema_desc = "\n".join([f"- {col.name} ({col.dtype})" for col in schema_profile])
         
@@ -95,8 +114,16 @@ class Agent:
         # 3. Validate Plan
         self._validate_plan(resp.steps, schema_profile)
         
+        # Only plans that passed validation are cached
+        with self._plan_cache_lock:
+            self._plan_cache[cache_key] = resp.model_dump_json()
         return resp
 
+    def _plan_cache_key(self, user_input: str, schema_profile: List[ColumnProfile]) -> str:
+        """Plans only depend on the prompt and the column names/types, not on the data itself."""
+        schema = json.dumps([(col.name, col.dtype) for col in schema_profile], sort_keys=True)
+        return hashlib.sha256(f"{user_input}|{schema}".encode()).hexdigest()
+
     def _validate_plan(self, steps: List[TransformStep], schema: List[ColumnProfile]):
         """
         Validates the generated steps against the schema.
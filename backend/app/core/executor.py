@@ -1,130 +1,135 @@
+import hashlib
+import json
+import polars as pl
 import pandas as pd
+import pyarrow.compute as pc
 import time
-from typing import List, Dict, Any
-from app.core.models import TransformStep, ExecutionResult, JobStatus
+from typing import List, Dict, Any, Union, Optional, Tuple
+from app.core.models import TransformStep, ExecutionResult, JobStatus, DatasetProfile
+
+# filter_rows operators, resolved once instead of walking an if/elif chain per step.
+# Each builds a native Polars predicate that the optimizer can push down.
+COMPARISON_FILTERS = {
+    ">": pl.Expr.gt,
+    "<": pl.Expr.lt,
+    ">=": pl.Expr.ge,
+    "<=": pl.Expr.le,
+    "==": pl.Expr.eq,
+    # Missing values count as "not equal", as in pandas
+    "!=": pl.Expr.ne_missing,
+}
+TEXT_FILTERS = {
+    "contains": lambda text, value: text.str.contains(value),
+    "startswith": lambda text, value: text.str.starts_with(value),
+    "endswith": lambda text, value: text.str.ends_with(value),
+}
+
+# standardize_text operations, run as Arrow compute kernels (faster than Polars' own on this version)
+TEXT_KERNELS = {
+    "lower": pc.utf8_lower,
+    "upper": pc.utf8_upper,
+    "strip": pc.utf8_trim_whitespace,
+}
+
+# String columns with fewer distinct values than this share of rows are deduplicated as categoricals
+LOW_CARDINALITY_RATIO = 0.5
 
 class DataframeProcessor:
+    """
+    Compiles a transformation plan into a single Polars lazy query.
+    Each operation maps a LazyFrame to a LazyFrame, so nothing is computed until
+    the whole plan is collected and the optimizer can reorder it (e.g. push filters down).
+    """
     def __init__(self):
         self.operations = {
             "drop_duplicates": self._drop_duplicates,
-            "fillna": self._fillna,
-            "convert_datetime": self._convert_datetime,
-            "standardize_text": self._standardize_text,
             "filter_rows": self._filter_rows,
             "drop_columns": self._drop_columns
         }
-
-    def apply_steps(self, df: pd.DataFrame, steps: List[TransformStep], job_id: str) -> ExecutionResult:
-        start_time = time.time()
-        original_rows = len(df)
-        
-        # 1. Snapshotting (Deep Copy)
-        working_df = df.copy(deep=True)
-        
-        # 2. Dry Run
-        try:
-            dry_run_df = df.head(10).copy(deep=True)
-            for i, step in enumerate(steps):
-                self._apply_single_step(dry_run_df, step)
-        except Exception as e:
-            return ExecutionResult(
-                job_id=job_id,
-                status=JobStatus.FAILED,
-                download_url=None,
-                metrics={},
-                error=f"Validation Failed: Step {i+1} ({step.operation}) caused error: {str(e)}"
-            )
-
-        # 3. Execution
-        executed_steps = 0
-        try:
-            for i, step in enumerate(steps):
-                working_df = self._apply_single_step(working_df, step)
-                executed_steps += 1
-                
-        except Exception as e:
-            return ExecutionResult(
-                job_id=job_id,
-                status=JobStatus.FAILED,
-                download_url=None,
-                metrics={},
-                error=f"Execution Failed: Step {i+1} ({step.operation}) caused error: {str(e)}"
-            )
-
-        # 4. Success Completion
-        execution_time = round(time.time() - start_time, 2)
-        final_rows = len(working_df)
-        
-        metrics = {
-            "input_rows": original_rows,
-            "output_rows": final_rows,
-            "steps_executed": executed_steps,
-            "execution_time_sec": execution_time,
-            "memory_usage_mb": round(working_df.memory_usage(deep=True).sum() / (1024 * 1024), 2)
+        # Column-wise operations return one expression per rewritten column,
+        # so consecutive steps on disjoint columns can share a with_columns context.
+        self.column_operations = {
+            "fillna": self._fillna,
+            "convert_datetime": self._convert_datetime,
+            "standardize_text": self._standardize_text
         }
 
-        # Save Result handled by caller (endpoints) or here? 
-        # Prompt said: "Action: Call Executor.apply_steps. Action: Save result..." 
-        # So this function returns the DF or lets caller save. 
-        # The prompt says `apply_steps` returns `ExecutionResult` in my interpretation of the return type 
-        # but 2.3 says `apply_steps(df, steps) -> pd.DataFrame`
-        # However 2.4 says "Return: Download URL".
-        # Let's return tuple (df, result_obj) or just have a wrapper.
-        # I'll stick to the class method applying steps returning DF, and a wrapper to generate result.
-        # But wait, my implementation above returns ExecutionResult. 
-        # I should probably return the modified DF and the metrics separately or handle saving outside.
-        # Let's make `apply_steps` return `(pd.DataFrame, dict)` (df, metrics) or raise Exception.
-        # AND handle the error catching inside to return a specific "Failed" state if needed.
-        # But for the `ExecutionResult` model I defined, I need to fit it.
-        # Let's adjust: This method returns the RESULT object. If successful, it also saves execution?
-        # The prompt section 2.3 says `apply_steps(df, steps) -> pd.DataFrame`.
-        # So I will refactor to match that signature exactly and handle the wrapping in the endpoint or a run_job method.
-        # Actually, let's keep the robust error handling here. 
-        # I'll modify the signature to return `(pd.DataFrame, ExecutionResult)` 
-        # If error, DF is None.
-        pass
-
-    def execute_plan(self, df: pd.DataFrame, steps: List[TransformStep], job_id: str) -> (pd.DataFrame, ExecutionResult):
+    @staticmethod
+    def plan_hash(steps: List[TransformStep]) -> str:
+        """Stable fingerprint of a plan, used to remember which plans already passed the dry run."""
+        payload = json.dumps([step.model_dump() for step in steps], default=str, sort_keys=True)
+        return hashlib.blake2b(payload.encode()).hexdigest()
+
+    def execute_plan(self, df: Union[pl.DataFrame, pd.DataFrame], steps: List[TransformStep], job_id: str, skip_dry_run: bool = False, profile: Optional[DatasetProfile] = None) -> (pl.DataFrame, ExecutionResult):
         start_time = time.time()
-        original_rows = len(df)
-        working_df = df.copy(deep=True)
+        if isinstance(df, pd.DataFrame):
+            df = pl.from_pandas(df)
+        original_rows = df.height
+        fused_steps, origins = self._fuse(steps)
+        fused_steps = self._hint_categoricals(fused_steps, profile)
+
+        # Dry Run (collected step by step on the sample so errors point at the failing step).
+        # Skipped when the caller already validated this exact plan against this dataset.
+        if not skip_dry_run:
+            try:
+                dry_run_df = df.head(10)
+                for i, step in enumerate(fused_steps):
+                    dry_run_df = self._apply_single_step(dry_run_df.lazy(), step).collect()
+            except Exception as e:
+                return None, ExecutionResult(
+                    job_id=job_id,
+                    status=JobStatus.FAILED,
+                    download_url=None,
+                    metrics={},
+                    error=f"Dry Run Failed: {self._step_label(origins[i])} ({step.operation}): {str(e)}"
+                )
 
-        # Dry Run
+        # Real Execution
+        # Column-wise steps touching disjoint columns are batched into one with_columns,
+        # which Polars evaluates in parallel across its thread pool.
         try:
-            dry_run_df = df.head(10).copy(deep=True)
-            for i, step in enumerate(steps):
-                self._apply_single_step(dry_run_df, step)
+            lf = df.lazy()
+            batch: Dict[str, pl.Expr] = {}
+            for i, step in enumerate(fused_steps):
+                # Built against the schema as of the pending batch, so dtypes it rewrites are seen
+                exprs = self._column_exprs(self._flush(lf, batch), step)
+                if exprs is None:
+                    lf, batch = self._flush(lf, batch), {}
+                    lf = self._apply_single_step(lf, step)
+                    continue
+                if batch.keys() & exprs.keys():
+                    # Overlapping columns: apply the batch first, the step reads its output
+                    lf, batch = self._flush(lf, batch), {}
+                batch.update(exprs)
+            lf = self._flush(lf, batch)
         except Exception as e:
-            return None, ExecutionResult(
+             return None, ExecutionResult(
                 job_id=job_id,
                 status=JobStatus.FAILED,
                 download_url=None,
                 metrics={},
-                error=f"Dry Run Failed: Step {i+1} ({step.operation}): {str(e)}"
+                error=f"Execution Failed: {self._step_label(origins[i])} ({step.operation}): {str(e)}"
             )
 
-        # Real Execution
-        executed_steps = 0
         try:
-            for i, step in enumerate(steps):
-                working_df = self._apply_single_step(working_df, step)
-                executed_steps += 1
+            working_df = lf.collect(streaming=True)
         except Exception as e:
              return None, ExecutionResult(
                 job_id=job_id,
                 status=JobStatus.FAILED,
                 download_url=None,
                 metrics={},
-                error=f"Execution Failed: Step {i+1} ({step.operation}): {str(e)}"
+                error=f"Execution Failed: {str(e)}"
             )
             
         execution_time = round(time.time() - start_time, 2)
         metrics = {
             "input_rows": original_rows,
-            "output_rows": len(working_df),
-            "steps_executed": executed_steps,
+            "output_rows": working_df.height,
+            "steps_executed": len(steps),
             "execution_time_sec": execution_time,
-            "memory_usage_mb": round(working_df.memory_usage(deep=True).sum() / (1024 * 1024), 2)
+            # Sums the Arrow buffer sizes; no per-value walk like pandas' memory_usage(deep=True)
+            "memory_usage_mb": round(working_df.estimated_size("mb"), 2)
         }
         
         return working_df, ExecutionResult(
@@ -135,93 +140,245 @@ class DataframeProcessor:
             error=None
         )
 
-    def _apply_single_step(self, df: pd.DataFrame, step: TransformStep) -> pd.DataFrame:
+    def _fuse(self, steps: List[TransformStep]) -> Tuple[List[TransformStep], List[List[int]]]:
+        """
+        Merges adjacent steps so each column is walked once per run of similar steps:
+        - consecutive 'standardize_text' steps on the same columns chain their operations
+        - consecutive 'fillna' steps with the same value merge their columns
+        The plan's own steps are left untouched; fused steps are new copies.
+        Also returns, per fused step, the indices of the plan steps it was built from.
+        """
+        fused: List[TransformStep] = []
+        notes: List[List[str]] = []
+        origins: List[List[int]] = []
+        for index, step in enumerate(steps):
+            merged_params = self._merge_params(fused[-1], step) if fused else None
+            note = step.explanation or step.operation
+            if merged_params is None:
+                fused.append(step)
+                notes.append([note])
+                origins.append([index])
+                continue
+            notes[-1].append(note)
+            origins[-1].append(index)
+            fused[-1] = fused[-1].model_copy(update={
+                "parameters": merged_params,
+                "explanation": f"Fused {len(notes[-1])} {step.operation} steps: " + "; ".join(notes[-1])
+            })
+        return fused, origins
+
+    @staticmethod
+    def _step_label(origin: List[int]) -> str:
+        """Names the plan step(s) behind a fused step, numbered as the user sees them."""
+        if len(origin) == 1:
+            return f"Step {origin[0] + 1}"
+        return f"Steps {origin[0] + 1}-{origin[-1] + 1}"
+
+    def _hint_categoricals(self, steps: List[TransformStep], profile: Optional[DatasetProfile]) -> List[TransformStep]:
+        """
+        Uses the upload profile to mark low-cardinality string columns in drop_duplicates subsets,
+        so the step hashes categorical codes instead of every string.
+        """
+        if profile is None:
+            return steps
+        low_cardinality = {
+            col.name for col in profile.columns
+            if col.dtype == "string" and col.unique_count < LOW_CARDINALITY_RATIO * profile.total_rows
+        }
+        hinted = []
+        for step in steps:
+            if step.operation == "drop_duplicates":
+                subset = step.parameters.get('subset') or [col.name for col in profile.columns]
+                categorical = [c for c in subset if c in low_cardinality]
+                if categorical:
+                    step = step.model_copy(update={"parameters": {**step.parameters, "categorical": categorical}})
+            hinted.append(step)
+        return hinted
+
+    def _merge_params(self, prev: TransformStep, step: TransformStep):
+        """Returns the parameters of prev and step combined, or None if they cannot be fused."""
+        if prev.operation != step.operation:
+            return None
+        a, b = prev.parameters, step.parameters
+
+        if step.operation == "standardize_text":
+            cols_a, cols_b = a.get('columns'), b.get('columns')
+            if not isinstance(cols_a, list) or not isinstance(cols_b, list) or set(cols_a) != set(cols_b):
+                return None
+            ops_a, ops_b = a.get('operation', 'lower'), b.get('operation', 'lower')
+            ops_a = ops_a if isinstance(ops_a, list) else [ops_a]
+            ops_b = ops_b if isinstance(ops_b, list) else [ops_b]
+            return {**a, 'operation': ops_a + ops_b}
+
+        if step.operation == "fillna":
+            value_a, value_b = a.get('value'), b.get('value')
+            # Compare types too so that 0, 0.0 and False are not treated as the same fill
+            if type(value_a) is not type(value_b) or value_a != value_b:
+                return None
+            cols_a, cols_b = a.get('columns'), b.get('columns')
+            if cols_a in ('all', None) or cols_b in ('all', None):
+                return {**a, 'columns': 'all'}
+            return {**a, 'columns': cols_a + [c for c in cols_b if c not in cols_a]}
+
+        return None
+
+    def _apply_single_step(self, lf: pl.LazyFrame, step: TransformStep) -> pl.LazyFrame:
+        exprs = self._column_exprs(lf, step)
+        if exprs is not None:
+            return self._flush(lf, exprs)
         op_func = self.operations.get(step.operation)
         if not op_func:
             raise ValueError(f"Unknown operation: {step.operation}")
-        return op_func(df, step.parameters)
+        return op_func(lf, step.parameters)
+
+    def _column_exprs(self, lf: pl.LazyFrame, step: TransformStep):
+        """Returns {column: expression} for column-wise steps, or None for any other step."""
+        op_func = self.column_operations.get(step.operation)
+        if not op_func:
+            return None
+        return op_func(lf.schema, step.parameters)
+
+    def _flush(self, lf: pl.LazyFrame, exprs: Dict[str, pl.Expr]) -> pl.LazyFrame:
+        return lf.with_columns(list(exprs.values())) if exprs else lf
 
     # --- Operation Implementations ---
 
-    def _drop_duplicates(self, df: pd.DataFrame, params: Dict) -> pd.DataFrame:
+    def _drop_duplicates(self, lf: pl.LazyFrame, params: Dict) -> pl.LazyFrame:
         subset = params.get('subset')
         keep = params.get('keep', 'first')
-        return df.drop_duplicates(subset=subset, keep=keep)
+        # pandas' keep=False drops every duplicated row
+        if keep is False:
+            keep = 'none'
 
-    def _fillna(self, df: pd.DataFrame, params: Dict) -> pd.DataFrame:
+        # Columns hinted by _hint_categoricals that are still strings at this point in the plan.
+        # They are only categorical for the dedup itself, since string ops do not accept categoricals.
+        schema = lf.schema
+        categorical = [c for c in params.get('categorical', []) if schema.get(c) == pl.Utf8]
+        if not categorical:
+            return lf.unique(subset=subset, keep=keep, maintain_order=True)
+        return (
+            lf.with_columns(pl.col(categorical).cast(pl.Categorical))
+            .unique(subset=subset, keep=keep, maintain_order=True)
+            .with_columns(pl.col(categorical).cast(pl.Utf8))
+        )
+
+    def _fillna(self, schema: Dict[str, pl.DataType], params: Dict) -> Dict[str, pl.Expr]:
         value = params.get('value')
         columns = params.get('columns')
         
-        if columns == 'all' or columns is None:
-            return df.fillna(value)
-        else:
-            # Only fill specified columns
-            # Create a dict for fillna {col: value} if strict, or just apply to subset
-            # df[columns] = df[columns].fillna(value)
-            # Safer to use dict to avoid SettingWithCopy warnings if slicing
-            fill_values = {col: value for col in columns if col in df.columns}
-            return df.fillna(value=fill_values)
-
-    def _convert_datetime(self, df: pd.DataFrame, params: Dict) -> pd.DataFrame:
+        fill_all = columns == 'all' or columns is None
+        if fill_all:
+            columns = list(schema)
+
+        # Only fill specified columns. fill_null would upcast the column to a supertype
+        # with the value (dates to ints, everything to strings), so the value is cast to
+        # the column's dtype instead and columns it does not fit are left alone.
+        filled = {}
+        for col in columns:
+            if col not in schema:
+                continue
+            if schema[col] == pl.Null:
+                # Entirely empty column: it takes the fill value's type
+                filled[col] = pl.col(col).fill_null(pl.lit(value))
+            elif self._fill_value_fits(schema[col], value):
+                filled[col] = pl.col(col).fill_null(pl.lit(value).cast(schema[col]))
+            elif not fill_all:
+                raise ValueError(f"Fill value {value!r} does not fit column '{col}' of type {schema[col]}")
+        return filled
+
+    @staticmethod
+    def _fill_value_fits(dtype: pl.DataType, value: Any) -> bool:
+        if isinstance(value, bool):
+            return dtype == pl.Boolean
+        if isinstance(value, int):
+            return dtype.is_integer() or dtype.is_float()
+        if isinstance(value, float):
+            return dtype.is_float() or (dtype.is_integer() and value.is_integer())
+        if isinstance(value, str):
+            return dtype == pl.Utf8
+        return False
+
+    def _convert_datetime(self, schema: Dict[str, pl.DataType], params: Dict) -> Dict[str, pl.Expr]:
         columns = params.get('columns')
         fmt = params.get('format') # Optional format
         errors = params.get('errors', 'coerce') # default to coerce to avoid crash
+        strict = errors == 'raise'
         
+        converted = {}
         for col in columns:
-            if col in df.columns:
-                if fmt:
-                    df[col] = pd.to_datetime(df[col], format=fmt, errors=errors)
+            if col in schema:
+                if schema[col].is_temporal():
+                    converted[col] = pl.col(col).cast(pl.Datetime)
+                elif fmt:
+                    converted[col] = pl.col(col).cast(pl.Utf8).str.to_datetime(format=fmt, strict=strict)
                 else:
-                    df[col] = pd.to_datetime(df[col], errors=errors)
-        return df
+                    # Polars' format inference only knows a few layouts and raises on the rest
+                    # ("1/5/2023 14:00", "Jan 5, 2023"), so unformatted columns are parsed by pandas.
+                    # The whole column goes in one batch so one inferred format applies to every row.
+                    converted[col] = pl.col(col).cast(pl.Utf8).map_batches(
+                        lambda series: self._parse_datetimes(series, errors), return_dtype=pl.Datetime("us")
+                    )
+        return converted
 
-    def _standardize_text(self, df: pd.DataFrame, params: Dict) -> pd.DataFrame:
+    @staticmethod
+    def _parse_datetimes(series: pl.Series, errors: str) -> pl.Series:
+        parsed = pd.to_datetime(series.to_pandas(), errors='raise' if errors == 'raise' else 'coerce')
+        if getattr(parsed.dt, "tz", None) is not None:
+            parsed = parsed.dt.tz_convert(None)  # offsets are normalized to naive UTC
+        return pl.from_pandas(parsed).cast(pl.Datetime("us")).alias(series.name)
+
+    def _standardize_text(self, schema: Dict[str, pl.DataType], params: Dict) -> Dict[str, pl.Expr]:
         columns = params.get('columns')
         operation = params.get('operation', 'lower')
+        # Fused steps carry a chain of operations applied in order
+        operations = operation if isinstance(operation, list) else [operation]
         
+        kernels = [TEXT_KERNELS[op] for op in operations if op in TEXT_KERNELS]
+        if not kernels:
+            # Unknown operations leave the columns untouched
+            return {}
+
+        def apply_kernels(series: pl.Series) -> pl.Series:
+            # One Arrow round trip for the whole chain of operations
+            arr = series.to_arrow()
+            for kernel in kernels:
+                arr = kernel(arr)
+            return pl.Series(series.name, arr)
+
+        standardized = {}
         for col in columns:
-            if col in df.columns:
-                if operation == 'lower':
-                    df[col] = df[col].astype(str).str.lower()
-                elif operation == 'upper':
-                    df[col] = df[col].astype(str).str.upper()
-                elif operation == 'strip':
-                    df[col] = df[col].astype(str).str.strip()
-        return df
-
-    def _filter_rows(self, df: pd.DataFrame, params: Dict) -> pd.DataFrame:
+            if col in schema:
+                expr = pl.col(col) if schema[col] == pl.Utf8 else pl.col(col).cast(pl.Utf8)
+                # Elementwise UDFs still stream and let filters be pushed past them
+                standardized[col] = expr.map_batches(apply_kernels, return_dtype=pl.Utf8, is_elementwise=True)
+        return standardized
+
+    def _filter_rows(self, lf: pl.LazyFrame, params: Dict) -> pl.LazyFrame:
         column = params.get('column')
         operator = params.get('operator')
         value = params.get('value')
         
-        if column not in df.columns:
-            return df # Should be caught by validation
-            
-        if operator == '>':
-            return df[df[column] > value]
-        elif operator == '<':
-            return df[df[column] < value]
-        elif operator == '>=':
-            return df[df[column] >= value]
-        elif operator == '<=':
-            return df[df[column] <= value]
-        elif operator == '==':
-            return df[df[column] == value]
-        elif operator == '!=':
-            return df[df[column] != value]
-        elif operator == 'contains':
-            return df[df[column].astype(str).str.contains(str(value), na=False)]
-        elif operator == 'startswith':
-             return df[df[column].astype(str).str.startswith(str(value), na=False)]
-        elif operator == 'endswith':
-             return df[df[column].astype(str).str.endswith(str(value), na=False)]
-        
-        return df
+        schema = lf.schema
+        if column not in schema:
+            return lf # Should be caught by validation
+
+        col = pl.col(column)
+        if operator in TEXT_FILTERS:
+            return lf.filter(TEXT_FILTERS[operator](col.cast(pl.Utf8), str(value)))
+
+        compare = COMPARISON_FILTERS.get(operator)
+        if compare is None:
+            return lf
+
+        # Polars does not compare dates to strings; parse the literal to the column's type
+        if schema[column].is_temporal() and isinstance(value, str):
+            value = pl.lit(value).str.to_datetime().cast(schema[column])
+        return lf.filter(compare(col, value))
 
-    def _drop_columns(self, df: pd.DataFrame, params: Dict) -> pd.DataFrame:
+    def _drop_columns(self, lf: pl.LazyFrame, params: Dict) -> pl.LazyFrame:
         columns = params.get('columns')
         # Only drop ones that exist to avoid error if duplicates in list or already dropped
-        cols_to_drop = [c for c in columns if c in df.columns]
-        return df.drop(columns=cols_to_drop)
+        cols_to_drop = [c for c in columns if c in lf.columns]
+        return lf.drop(cols_to_drop)
 
 processor = DataframeProcessor()
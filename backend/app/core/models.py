@@ -1,6 +1,6 @@
 from enum import Enum
 from typing import List, Dict, Union, Any, Optional
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 
 class JobStatus(str, Enum):
     PENDING = "pending"
@@ -11,6 +11,9 @@ class JobStatus(str, Enum):
     FAILED = "failed"
 
 class ColumnProfile(BaseModel):
+    # NaN/inf in data-derived values serialize as null, matching what orjson emits
+    model_config = ConfigDict(ser_json_inf_nan='null')
+
     name: str
     dtype: str
     null_count: int
@@ -28,6 +31,8 @@ class AIResponse(BaseModel):
     steps: List[TransformStep]
 
 class DatasetProfile(BaseModel):
+    model_config = ConfigDict(ser_json_inf_nan='null')
+
     job_id: str
     filename: str
     total_rows: int
@@ -48,6 +53,8 @@ class ExecutionRequest(BaseModel):
     approved: bool
 
 class ExecutionResult(BaseModel):
+    model_config = ConfigDict(ser_json_inf_nan='null')
+
     job_id: str
     status: JobStatus
     download_url: Optional[str]
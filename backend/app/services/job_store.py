@@ -0,0 +1,81 @@
+import os
+import pyarrow as pa
+import redis.asyncio as redis
+from cachetools import LRUCache
+from typing import Optional
+from app.core.models import DatasetProfile, AIResponse
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# How long job state (profile, plan) survives without being rewritten.
+JOB_TTL_SEC = int(os.getenv("JOB_TTL_SEC", "3600"))
+# Upper bound on the Arrow buffers kept in memory across all jobs.
+TABLE_CACHE_BYTES = int(os.getenv("TABLE_CACHE_MB", "1024")) * 1024 * 1024
+
+class JobStore:
+    """
+    Registry of uploaded datasets and their plans.
+    Profiles, plans and content mappings live in Redis so any worker can serve
+    any job. Parsed tables cannot be shared across processes; each worker keeps
+    its own byte-sized LRU cache of them, keyed by file content, and re-reads
+    the file on a miss.
+    """
+    def __init__(self, client: Optional[redis.Redis] = None, ttl: int = JOB_TTL_SEC, max_table_bytes: int = TABLE_CACHE_BYTES):
+        self.redis = client or redis.from_url(REDIS_URL)
+        self.ttl = ttl
+        self.tables: LRUCache = LRUCache(maxsize=max_table_bytes, getsizeof=lambda table: table.nbytes)
+
+    # --- Profiles ---
+
+    async def get(self, job_id: str) -> Optional[DatasetProfile]:
+        data = await self.redis.get(f"job:{job_id}")
+        return DatasetProfile.model_validate_json(data) if data else None
+
+    async def add(self, profile: DatasetProfile, content_name: str, table: Optional[pa.Table] = None):
+        job_id = profile.job_id
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.setex(f"job:{job_id}", self.ttl, profile.model_dump_json())
+            pipe.setex(f"job:{job_id}:content", self.ttl, content_name)
+            # First job profiled with this content; later identical uploads reuse its profile
+            pipe.set(f"content:{content_name}", job_id, ex=self.ttl, nx=True)
+            await pipe.execute()
+        if table is not None:
+            self._cache_content_table(content_name, table)
+
+    async def find_by_content(self, content_name: str) -> Optional[DatasetProfile]:
+        """Returns the profile of an earlier upload with identical content, if any."""
+        job_id = await self.redis.get(f"content:{content_name}")
+        return await self.get(job_id.decode()) if job_id else None
+
+    # --- Parsed tables (per worker) ---
+
+    async def cache_table(self, job_id: str, table: pa.Table):
+        self._cache_content_table(await self._content_key(job_id), table)
+
+    def _cache_content_table(self, content_key: str, table: pa.Table):
+        # Tables bigger than the whole cache are simply re-read on demand.
+        if table.nbytes <= self.tables.maxsize:
+            self.tables[content_key] = table
+
+    async def get_table(self, job_id: str) -> Optional[pa.Table]:
+        return self.tables.get(await self._content_key(job_id))
+
+    async def _content_key(self, job_id: str) -> str:
+        content_name = await self.redis.get(f"job:{job_id}:content")
+        return content_name.decode() if content_name else job_id
+
+    # --- Plans ---
+
+    async def get_plan(self, job_id: str) -> Optional[AIResponse]:
+        data = await self.redis.get(f"plan:{job_id}")
+        return AIResponse.model_validate_json(data) if data else None
+
+    async def set_plan(self, job_id: str, plan: AIResponse):
+        await self.redis.setex(f"plan:{job_id}", self.ttl, plan.model_dump_json())
+
+    async def get_validated_hash(self, job_id: str) -> Optional[str]:
+        """Hash of the last plan that passed the dry run on this job's data."""
+        plan_hash = await self.redis.get(f"plan:{job_id}:validated")
+        return plan_hash.decode() if plan_hash else None
+
+    async def set_validated_hash(self, job_id: str, plan_hash: str):
+        await self.redis.setex(f"plan:{job_id}:validated", self.ttl, plan_hash)
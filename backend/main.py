@@ -1,9 +1,21 @@
+import anyio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.endpoints import router as api_router
 import os
 
-app = FastAPI(title="FRIDATA API", version="1.0")
+# Worker threads for blocking endpoint work (file parsing, plan execution, LLM calls)
+THREADPOOL_SIZE = 64
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    yield
+
+# orjson serializes the preview/metrics payloads much faster than the stdlib json encoder
+app = FastAPI(title="FRIDATA API", version="1.0", lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # CORS Setup
 origins = [
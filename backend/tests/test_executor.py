@@ -0,0 +1,14 @@
+import polars as pl
+from datetime import datetime
+from app.core.executor import DataframeProcessor
+from app.core.models import TransformStep, JobStatus
+
+def test_convert_datetime_without_format_coerces_non_iso_values():
+    df = pl.DataFrame({"when": ["1/5/2023 14:00", "1/6/2023 09:30", None, "not a date"]})
+    steps = [TransformStep(operation="convert_datetime", parameters={"columns": ["when"]})]
+
+    result_df, result = DataframeProcessor().execute_plan(df, steps, "job")
+
+    assert result.status == JobStatus.COMPLETED
+    assert result_df.schema["when"] == pl.Datetime("us")
+    assert result_df["when"].to_list() == [datetime(2023, 1, 5, 14, 0), datetime(2023, 1, 6, 9, 30), None, None]